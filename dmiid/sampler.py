@@ -0,0 +1,519 @@
+# This file is part of dmiid.
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2015 André Erdmann <dywi@mailerd.de>
+#
+# Distributed under the terms of the MIT license.
+# (See LICENSE.MIT or http://opensource.org/licenses/MIT)
+#
+
+"""Periodically samples numeric sysfs attributes into ring buffers."""
+
+from __future__ import absolute_import
+from __future__ import unicode_literals, division, generators
+from __future__ import print_function, nested_scopes, with_statement
+
+import array
+import collections
+import time
+
+try:
+   # pylint: disable=F0401
+   import numpy
+except ImportError:
+   # pylint: disable=C0103
+   numpy = None
+
+__all__ = [ 'SampleRingBuffer', 'SamplerStats', 'SysFsSampler', ]
+
+
+# pylint: disable=C0103
+_monotonic = getattr ( time, 'monotonic', time.time )
+
+
+SamplerStats = collections.namedtuple (
+   'SamplerStats', 'ticks missed max_lag mean_lag'
+)
+
+
+def parse_numeric ( value ):
+   """Converts a (deserialized) sysfs attribute value into a float.
+
+   @param value: attribute value
+   @type  value: C{str}, C{int}, C{float} or None
+   @return:      numeric value or None if value is not numeric
+   @rtype:       C{float} or None
+   """
+   if value is None:
+      return None
+
+   try:
+      return float ( value )
+   except ( TypeError, ValueError ):
+      return None
+# --- end of parse_numeric (...) ---
+
+
+class SampleRingBuffer ( object ):
+   """A fixed-size buffer of (timestamp, value) samples.
+
+   Storage gets preallocated on initialization, appending a sample
+   overwrites the oldest one once the buffer is full.
+
+   @ivar capacity:    max number of samples
+   @type capacity:    C{int}
+   @ivar timestamps:  timestamp storage (not in chronological order)
+   @type timestamps:  C{array.array} or C{numpy.ndarray}
+   @ivar values:      value storage (not in chronological order)
+   @type values:      C{array.array} or C{numpy.ndarray}
+   @ivar _pos:        index of the next write
+   @type _pos:        C{int}
+   @ivar _count:      number of samples stored
+   @type _count:      C{int}
+   @ivar _numpy:      whether the storage arrays are numpy arrays
+   @type _numpy:      bool
+   """
+
+   def __init__ ( self, capacity, use_numpy=None ):
+      """Constructor.
+
+      @param capacity:  max number of samples, must be > 0
+      @type  capacity:  C{int}
+      @param use_numpy: whether to use numpy arrays as storage.
+                        Defaults to None (=> use numpy if available).
+      @type  use_numpy: bool or None
+      """
+      super ( SampleRingBuffer, self ).__init__()
+      if capacity < 1:
+         raise ValueError ( capacity )
+
+      if use_numpy is None:
+         use_numpy = numpy is not None
+      elif use_numpy and numpy is None:
+         raise ValueError ( "numpy is not available" )
+
+      self.capacity = capacity
+      self._numpy   = bool ( use_numpy )
+      self._pos     = 0
+      self._count   = 0
+
+      if self._numpy:
+         self.timestamps = numpy.zeros ( capacity, dtype=numpy.float64 )
+         self.values     = numpy.zeros ( capacity, dtype=numpy.float64 )
+      else:
+         self.timestamps = array.array ( str("d"), [ 0.0 ] ) * capacity
+         self.values     = array.array ( str("d"), [ 0.0 ] ) * capacity
+   # --- end of __init__ (...) ---
+
+   def __len__ ( self ):
+      return self._count
+   # --- end of __len__ (...) ---
+
+   def clear ( self ):
+      """Removes all samples (without releasing the storage)."""
+      self._pos   = 0
+      self._count = 0
+   # --- end of clear (...) ---
+
+   def append ( self, timestamp, value ):
+      """Adds a sample, possibly overwriting the oldest one.
+
+      @param timestamp: sample timestamp
+      @type  timestamp: C{float}
+      @param value:     sample value
+      @type  value:     C{float}
+      """
+      pos = self._pos
+      self.timestamps [pos] = timestamp
+      self.values [pos]     = value
+      self._pos = ( pos + 1 ) % self.capacity
+      if self._count < self.capacity:
+         self._count += 1
+   # --- end of append (...) ---
+
+   def _get_window_ranges ( self, nsamples ):
+      """Returns up to two index ranges that, when concatenated, cover
+      the most recent samples in chronological order.
+
+      @param nsamples: number of samples or None (=> all samples)
+      @type  nsamples: C{int} or None
+      @return:         list of 2-tuples C{(start, end)}
+      @rtype:          C{list}
+      """
+      count = self._count
+      if nsamples is not None and nsamples < count:
+         count = max ( 0, nsamples )
+
+      start = ( self._pos - count ) % self.capacity
+      end   = start + count
+
+      if count == 0:
+         return []
+      elif end <= self.capacity:
+         return [ ( start, end ) ]
+      else:
+         return [ ( start, self.capacity ), ( 0, end - self.capacity ) ]
+   # --- end of _get_window_ranges (...) ---
+
+   def get_window ( self, nsamples=None ):
+      """Returns the most recent samples in chronological order.
+
+      @param nsamples: number of samples. Defaults to None (=> all samples).
+      @type  nsamples: C{int} or None
+      @return:         2-tuple C{(timestamps, values)}
+      @rtype:          2-tuple of C{array.array} or C{numpy.ndarray}
+      """
+      ranges = self._get_window_ranges ( nsamples )
+
+      if self._numpy:
+         if not ranges:
+            return ( self.timestamps[:0], self.values[:0] )
+         return (
+            numpy.concatenate ( [ self.timestamps[a:b] for a, b in ranges ] ),
+            numpy.concatenate ( [ self.values[a:b] for a, b in ranges ] )
+         )
+
+      else:
+         timestamps = self.timestamps[:0]
+         values     = self.values[:0]
+         for start, end in ranges:
+            timestamps.extend ( self.timestamps[start:end] )
+            values.extend ( self.values[start:end] )
+         return ( timestamps, values )
+   # --- end of get_window (...) ---
+
+   def get_last ( self ):
+      """Returns the most recent sample.
+
+      @return: 2-tuple C{(timestamp, value)} or None if the buffer is empty
+      @rtype:  2-tuple C{(float, float)} or None
+      """
+      if not self._count:
+         return None
+      pos = ( self._pos - 1 ) % self.capacity
+      return ( self.timestamps [pos], self.values [pos] )
+   # --- end of get_last (...) ---
+
+   def min ( self, nsamples=None ):
+      """
+      @param nsamples: window size, see L{get_window()}
+      @return:         smallest value in the window or None if empty
+      @rtype:          C{float} or None
+      """
+      _, values = self.get_window ( nsamples )
+      if not len ( values ):
+         return None
+      return float ( values.min() if self._numpy else min ( values ) )
+   # --- end of min (...) ---
+
+   def max ( self, nsamples=None ):
+      """
+      @param nsamples: window size, see L{get_window()}
+      @return:         greatest value in the window or None if empty
+      @rtype:          C{float} or None
+      """
+      _, values = self.get_window ( nsamples )
+      if not len ( values ):
+         return None
+      return float ( values.max() if self._numpy else max ( values ) )
+   # --- end of max (...) ---
+
+   def mean ( self, nsamples=None ):
+      """
+      @param nsamples: window size, see L{get_window()}
+      @return:         arithmetic mean of the window or None if empty
+      @rtype:          C{float} or None
+      """
+      _, values = self.get_window ( nsamples )
+      if not len ( values ):
+         return None
+      elif self._numpy:
+         return float ( values.mean() )
+      else:
+         return sum ( values ) / len ( values )
+   # --- end of mean (...) ---
+
+   def rate ( self, nsamples=None ):
+      """Returns the average change of the value per time unit
+      (first and last sample of the window).
+
+      @param nsamples: window size, see L{get_window()}
+      @return:         rate or None if less than two samples are available
+                       or no time has passed
+      @rtype:          C{float} or None
+      """
+      ranges = self._get_window_ranges ( nsamples )
+      if not ranges:
+         return None
+
+      first = ranges[0][0]
+      last  = ranges[-1][1] - 1
+      tdiff = self.timestamps [last] - self.timestamps [first]
+      if tdiff <= 0:
+         return None
+      return float ( self.values [last] - self.values [first] ) / tdiff
+   # --- end of rate (...) ---
+
+# --- end of SampleRingBuffer ---
+
+
+class SysFsSampler ( object ):
+   """Reads numeric attributes from one or more sysfs attribute dicts
+   on a fixed schedule and stores their values in ring buffers.
+
+   Each tick reads all attributes of an attribute dict in one batched pass.
+   Missing, unreadable or non-numeric values get skipped.
+
+   Samples are identified by the filesystem path of their attribute,
+   see L{get_buffer()}.
+
+   @ivar interval:   time between two ticks, in seconds
+   @type interval:   C{float}
+   @ivar capacity:   number of samples kept per attribute
+   @type capacity:   C{int}
+   @ivar buffers:    mapping C{attribute fspath => ring buffer}
+   @type buffers:    C{dict} :: C{str} => L{SampleRingBuffer}
+   @ivar _groups:    list of 3-tuples
+                     C{(attribute dict, normalized keys, ring buffers)}
+   @type _groups:    C{list}
+   @ivar _use_numpy: see L{SampleRingBuffer.__init__()}
+   @type _use_numpy: bool or None
+   @ivar _parse:     function that converts attribute values into floats
+   @type _parse:     callable C{value => float or None}
+   @ivar _clock:     monotonic clock function
+   @type _clock:     callable
+   @ivar _sleep:     sleep function
+   @type _sleep:     callable
+   @ivar _stop:      whether L{run()} should stop before the next tick
+   @type _stop:      bool
+
+   @ivar _ticks:     number of ticks
+   @type _ticks:     C{int}
+   @ivar _missed:    number of ticks that have been skipped
+                     because the sampler fell behind schedule
+   @type _missed:    C{int}
+   @ivar _max_lag:   greatest delay between deadline and actual tick
+   @type _max_lag:   C{float}
+   @ivar _lag_sum:   accumulated tick delays
+   @type _lag_sum:   C{float}
+   """
+
+   def __init__ (
+      self, interval, capacity,
+      use_numpy=None, parse=parse_numeric, clock=None, sleep=None
+   ):
+      """Constructor.
+
+      @param interval:  time between two ticks, in seconds
+      @type  interval:  C{float}
+      @param capacity:  number of samples kept per attribute
+      @type  capacity:  C{int}
+      @param use_numpy: see L{SampleRingBuffer.__init__()}
+      @type  use_numpy: bool or None
+      @param parse:     function that converts attribute values into floats
+                        Defaults to L{parse_numeric()}.
+      @type  parse:     callable C{value => float or None}
+      @param clock:     clock function. Defaults to None (=> monotonic clock).
+      @type  clock:     callable or None
+      @param sleep:     sleep function. Defaults to None (=> C{time.sleep}).
+      @type  sleep:     callable or None
+      """
+      super ( SysFsSampler, self ).__init__()
+      if interval <= 0:
+         raise ValueError ( interval )
+      elif capacity < 1:
+         raise ValueError ( capacity )
+
+      self.interval   = interval
+      self.capacity   = capacity
+      self.buffers    = {}
+      self._groups    = []
+      self._use_numpy = use_numpy
+      self._parse     = parse
+      self._clock     = clock if clock is not None else _monotonic
+      self._sleep     = sleep if sleep is not None else time.sleep
+      self._stop      = False
+
+      self._ticks     = 0
+      self._missed    = 0
+      self._max_lag   = 0.0
+      self._lag_sum   = 0.0
+   # --- end of __init__ (...) ---
+
+   def _get_group ( self, attr_dict ):
+      """Returns the sample group of the given attribute dict, creates it
+      if necessary.
+
+      @param attr_dict: attribute dict
+      @type  attr_dict: L{dmiid.sysfsattr.ReadonlySysFsAttrDict}
+      @return:          3-tuple C{(attribute dict, normalized keys, buffers)}
+      @rtype:           3-tuple
+      """
+      for group in self._groups:
+         if group[0] is attr_dict:
+            return group
+
+      group = ( attr_dict, [], [] )
+      self._groups.append ( group )
+      return group
+   # --- end of _get_group (...) ---
+
+   def add ( self, attr_dict, *attr_keys ):
+      """Registers attributes for sampling.
+
+      Adding an attribute more than once has no effect.
+
+      @param attr_dict: attribute dict
+      @type  attr_dict: L{dmiid.sysfsattr.ReadonlySysFsAttrDict}
+      @param attr_keys: attribute keys
+      @type  attr_keys: *args of C{str}
+      @return:          list of the attributes' ring buffers
+      @rtype:           C{list} of L{SampleRingBuffer}
+      """
+      _, attr_normkeys, buffers = self._get_group ( attr_dict )
+      ret = []
+
+      for attr_key in attr_keys:
+         attr_normkey = attr_dict.normalize_key ( attr_key )
+         fspath       = attr_dict.get_fspath ( attr_normkey )
+
+         try:
+            buf = self.buffers [fspath]
+         except KeyError:
+            buf = SampleRingBuffer ( self.capacity, self._use_numpy )
+            self.buffers [fspath] = buf
+            attr_normkeys.append ( attr_normkey )
+            buffers.append ( buf )
+         # --
+
+         ret.append ( buf )
+      # -- end for
+
+      return ret
+   # --- end of add (...) ---
+
+   def get_buffer ( self, attr_dict, attr_key ):
+      """Returns the ring buffer of an attribute.
+
+      @raises KeyError: attribute not registered
+
+      @param attr_dict: attribute dict
+      @type  attr_dict: L{dmiid.sysfsattr.ReadonlySysFsAttrDict}
+      @param attr_key:  attribute key
+      @type  attr_key:  C{str}
+      @return:          ring buffer
+      @rtype:           L{SampleRingBuffer}
+      """
+      return self.buffers [
+         attr_dict.get_fspath ( attr_dict.normalize_key ( attr_key ) )
+      ]
+   # --- end of get_buffer (...) ---
+
+   def sample ( self, timestamp=None ):
+      """Reads all registered attributes once.
+
+      The attributes are read with the C{bypass} and C{nofail} options,
+      see L{dmiid.sysfsattr.ReadonlySysFsAttrDict._getitem()}.
+
+      @param timestamp: sample timestamp. Defaults to None (=> clock()).
+      @type  timestamp: C{float} or None
+      """
+      if timestamp is None:
+         timestamp = self._clock()
+
+      parse = self._parse
+      for attr_dict, attr_normkeys, buffers in self._groups:
+         attr_values = attr_dict.iget_attributes (
+            *attr_normkeys, bypass=True
+         )
+         for buf, ( _, attr_value ) in zip ( buffers, attr_values ):
+            value = parse ( attr_value )
+            if value is not None:
+               buf.append ( timestamp, value )
+   # --- end of sample (...) ---
+
+   def stop ( self ):
+      """Makes L{run()} return before its next tick.
+      May be called from another thread or from within the sample loop.
+      """
+      self._stop = True
+   # --- end of stop (...) ---
+
+   def run ( self, num_ticks=None ):
+      """Samples all registered attributes on a fixed schedule.
+
+      Deadlines are computed relative to the start time, so that the
+      schedule does not drift.
+      If a tick is late by one interval or more, the deadlines in between
+      are skipped and counted as missed.
+
+      A L{stop()} request issued before this method gets called makes it
+      return immediately; the request is consumed on return.
+
+      @param num_ticks: max number of ticks.
+                        Defaults to None (=> run until L{stop()} gets called).
+      @type  num_ticks: C{int} or None
+      """
+      interval   = self.interval
+      clock      = self._clock
+      sleep      = self._sleep
+      start      = clock()
+      slot       = 0
+      ticks_done = 0
+
+      try:
+         while not self._stop and (
+            num_ticks is None or ticks_done < num_ticks
+         ):
+            deadline = start + slot * interval
+            now      = clock()
+
+            if now < deadline:
+               sleep ( deadline - now )
+               now = clock()
+
+            # lag relative to the missed deadline, recorded before
+            # realigning the schedule
+            lag = now - deadline
+            if lag >= interval:
+               skipped       = int ( lag // interval )
+               self._missed += skipped
+               slot         += skipped
+            # --
+
+            self.sample ( now )
+            self._ticks   += 1
+            self._lag_sum += lag
+            if lag > self._max_lag:
+               self._max_lag = lag
+
+            ticks_done += 1
+            slot       += 1
+         # -- end while
+      finally:
+         self._stop = False
+   # --- end of run (...) ---
+
+   def get_stats ( self ):
+      """Returns scheduling statistics.
+
+      @return: C{(ticks, missed, max_lag, mean_lag)}
+      @rtype:  L{SamplerStats}
+      """
+      return SamplerStats (
+         self._ticks,
+         self._missed,
+         self._max_lag,
+         ( self._lag_sum / self._ticks ) if self._ticks else 0.0
+      )
+   # --- end of get_stats (...) ---
+
+   def reset_stats ( self ):
+      """Resets the scheduling statistics."""
+      self._ticks   = 0
+      self._missed  = 0
+      self._max_lag = 0.0
+      self._lag_sum = 0.0
+   # --- end of reset_stats (...) ---
+
+# --- end of SysFsSampler ---
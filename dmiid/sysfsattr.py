@@ -15,17 +15,76 @@ from __future__ import print_function, nested_scopes, with_statement
 
 import errno
 import collections
+import fnmatch
 import io
 import os
+import re
 
 try:
    import collections.abc as _collections_abc
 except ImportError:
    _collections_abc = collections
 
+try:
+   _scandir = os.scandir
+except AttributeError:
+   try:
+      # pylint: disable=F0401
+      from scandir import scandir as _scandir
+   except ImportError:
+      _scandir = None
+
 __all__ = [ 'ReadonlySysFsAttrDict', ]
 
 
+_RE_GLOB_MAGIC = re.compile ( r'[*?[]' )
+
+
+def _get_regex_literal_prefix ( regex ):
+   """Returns the literal text that any string matched by the given regexp
+   (with C{match()}) must begin with.
+
+   The result may be shorter than the actual literal prefix, e.g. for
+   case-insensitive or verbose regexps or regexps containing alternatives,
+   it is empty.
+
+   @param regex: compiled regexp
+   @type  regex: compiled regexp (C{re.compile()})
+   @return:      literal prefix, possibly empty
+   @rtype:       C{str}
+   """
+   src = regex.pattern
+   if ( regex.flags & ( re.I | re.X ) ) or '|' in src:
+      return ''
+
+   chars = []
+   idx   = 1 if src.startswith ( '^' ) else 0
+   while idx < len(src):
+      if src[idx] == '\\':
+         if idx + 1 < len(src) and not src[idx+1].isalnum():
+            literal, step = src[idx+1], 2
+         else:
+            break
+      elif src[idx] in '.^$*+?{}[]()':
+         break
+      else:
+         literal, step = src[idx], 1
+
+      next_char = src[idx+step:idx+step+1]
+      if next_char and next_char in '*?{':
+         # preceding char is optional
+         break
+
+      chars.append ( literal )
+      if next_char == '+':
+         break
+      idx += step
+   # -- end while
+
+   return ''.join ( chars )
+# --- end of _get_regex_literal_prefix (...) ---
+
+
 class ReadonlySysFsAttrDict ( _collections_abc.Mapping ):
    """An object for accessing files under /sys/ in a dict-like fashion,
    meant for reading file that don't change often, e.g. information that
@@ -47,19 +106,26 @@ class ReadonlySysFsAttrDict ( _collections_abc.Mapping ):
    @ivar _fname_cache:  a set of file names found in L{root} (non-recursive),
                          used to speed up __contains__ checks
    @type _fname_cache:  C{set}
+   @ivar _dir_index:    cached directory listings used for attribute queries,
+                        mapping C{relative dir => (files, dirs, link dirs)}
+   @type _dir_index:    C{dict}
 
 
    @group Attribute access:  __getitem__, get,
                              get_attributes, iget_attributes,
                              items, values, keys
 
+   @group Attribute query:   query, iquery
+
    @group Data convertion / normalization: deserialize_value, normalize_key,
                                            get_fspath
 
-   @group Cache management: clear, drop
+   @group Cache management: clear, drop, drop_index
 
    @group Private Methods:  _drop, _get, _get_filename_cache, _getitem,
-                            _iget_attributes_v, _open_attr_text_file, _read_attr
+                            _iget_attributes_v, _open_attr_text_file,
+                            _read_attr, _scan_dir, _get_dir_index, _iglob_keys,
+                            _iregex_keys, _iquery_keys
    """
 
    DICT_TYPE     = dict
@@ -76,6 +142,7 @@ class ReadonlySysFsAttrDict ( _collections_abc.Mapping ):
       self.root         = os.path.abspath ( root )
       self.data         = self.__class__.DICT_TYPE()
       self._fname_cache = self._get_filename_cache()
+      self._dir_index   = {}
    # --- end of __init__ (...) ---
 
    def get_fspath ( self, relpath ):
@@ -139,8 +206,10 @@ class ReadonlySysFsAttrDict ( _collections_abc.Mapping ):
    # --- end of _get_filename_cache (...) ---
 
    def clear ( self ):
-      """Empties the data cache and regenerates the file name cache."""
+      """Empties the data cache and the directory index
+      and regenerates the file name cache."""
       self.data.clear()
+      self.drop_index()
       self._fname_cache = self._get_filename_cache()
    # --- end of clear (...) ---
 
@@ -445,6 +514,290 @@ class ReadonlySysFsAttrDict ( _collections_abc.Mapping ):
       return list ( self.iget_attributes ( *attr_keys, **kwargs ) )
    # --- end of get_attributes (...) ---
 
+   def _scan_dir ( self, attr_reldir ):
+      """Lists a directory under L{self.root}.
+
+      Uses C{scandir()} if available, so that entry types can be determined
+      without extra stat calls (except for symlinks).
+      Unreadable directories are treated as empty.
+
+      @param attr_reldir: relative directory path (empty str for L{root})
+      @type  attr_reldir: C{str}
+      @return:            3-tuple C{(file names, dir names, link dir names)},
+                          where dir names include symlinks to directories
+                          and link dir names is the set of these symlinks
+      @rtype:             3-tuple C{(tuple, tuple, frozenset)}
+      """
+      dirpath   = self.get_fspath ( attr_reldir )
+      filenames = []
+      dirnames  = []
+      linkdirs  = set()
+
+      try:
+         if _scandir is not None:
+            for entry in _scandir ( dirpath ):
+               try:
+                  if entry.is_dir():
+                     dirnames.append ( entry.name )
+                     if entry.is_symlink():
+                        linkdirs.add ( entry.name )
+                  elif entry.is_file():
+                     filenames.append ( entry.name )
+               except OSError:
+                  pass
+
+         else:
+            for name in os.listdir ( dirpath ):
+               path = os.path.join ( dirpath, name )
+               if os.path.isdir ( path ):
+                  dirnames.append ( name )
+                  if os.path.islink ( path ):
+                     linkdirs.add ( name )
+               elif os.path.isfile ( path ):
+                  filenames.append ( name )
+      except OSError:
+         pass
+
+      return (
+         tuple ( sorted ( filenames ) ),
+         tuple ( sorted ( dirnames ) ),
+         frozenset ( linkdirs )
+      )
+   # --- end of _scan_dir (...) ---
+
+   def _get_dir_index ( self, attr_reldir ):
+      """Returns the cached listing of a directory under L{self.root},
+      see L{_scan_dir()}.
+
+      @param attr_reldir: relative directory path (empty str for L{root})
+      @type  attr_reldir: C{str}
+      @return:            3-tuple C{(file names, dir names, link dir names)}
+      @rtype:             3-tuple C{(tuple, tuple, frozenset)}
+      """
+      try:
+         return self._dir_index [attr_reldir]
+      except KeyError:
+         entry = self._scan_dir ( attr_reldir )
+         self._dir_index [attr_reldir] = entry
+         return entry
+   # --- end of _get_dir_index (...) ---
+
+   def drop_index ( self ):
+      """Empties the directory index used by L{iquery()},
+      but keeps the data cache.
+
+      Should be called after devices have been added or removed.
+      """
+      self._dir_index.clear()
+   # --- end of drop_index (...) ---
+
+   def _iglob_keys ( self, attr_reldir, parts, followlinks ):
+      """Generator that yields the normalized keys of all attributes
+      under the given directory that match a glob pattern.
+
+      Each pattern part matches exactly one path component, so the
+      traversal depth is bounded even if symlinks are followed.
+
+      @param attr_reldir: relative directory path (empty str for L{root})
+      @type  attr_reldir: C{str}
+      @param parts:       pattern split into path components (not empty)
+      @type  parts:       C{list} of C{str}
+      @param followlinks: whether to descend into symlinks to directories
+      @type  followlinks: bool
+      """
+      filenames, dirnames, linkdirs = self._get_dir_index ( attr_reldir )
+      head = parts[0]
+
+      if len(parts) > 1:
+         candidates = dirnames
+      else:
+         candidates = filenames
+
+      if _RE_GLOB_MAGIC.search ( head ) is None:
+         names = [ head ] if head in candidates else []
+      else:
+         names = [ n for n in candidates if fnmatch.fnmatchcase ( n, head ) ]
+
+      for name in names:
+         attr_relpath = (
+            os.path.join ( attr_reldir, name ) if attr_reldir else name
+         )
+         if len(parts) == 1:
+            yield attr_relpath
+
+         elif followlinks or name not in linkdirs:
+            for attr_normkey in self._iglob_keys (
+               attr_relpath, parts[1:], followlinks
+            ):
+               yield attr_normkey
+   # --- end of _iglob_keys (...) ---
+
+   def _iregex_keys ( self, regex, prefix, attr_reldir, real_dirs ):
+      """Generator that yields the normalized keys of all attributes
+      under the given directory that match a regexp.
+
+      Directories that cannot contain keys beginning with C{prefix}
+      are not traversed.
+
+      Symlinks to directories are followed only if C{real_dirs} is not None.
+      In that case, a symlink gets skipped if it resolves to an ancestor
+      of the current directory (symlink loop).
+
+      @param regex:       compiled regexp
+      @type  regex:       compiled regexp (C{re.compile()})
+      @param prefix:      literal prefix of the regexp
+      @type  prefix:      C{str}
+      @param attr_reldir: relative directory path (empty str for L{root})
+      @type  attr_reldir: C{str}
+      @param real_dirs:   None if symlinks should not be followed, else
+                          a list of resolved paths, where the last item is
+                          the current directory and the other items are
+                          the directories the followed symlinks on the
+                          current path were found in
+      @type  real_dirs:   C{list} of C{str} or None
+      """
+      filenames, dirnames, linkdirs = self._get_dir_index ( attr_reldir )
+
+      for name in filenames:
+         attr_relpath = (
+            os.path.join ( attr_reldir, name ) if attr_reldir else name
+         )
+         if (
+            attr_relpath.startswith ( prefix )
+            and regex.match ( attr_relpath ) is not None
+         ):
+            yield attr_relpath
+      # --
+
+      for name in dirnames:
+         attr_relpath = (
+            os.path.join ( attr_reldir, name ) if attr_reldir else name
+         )
+         dir_prefix = attr_relpath + os.path.sep
+         if not (
+            dir_prefix.startswith ( prefix )
+            or prefix.startswith ( dir_prefix )
+         ):
+            continue
+
+         if real_dirs is None:
+            if name in linkdirs:
+               continue
+            sub_real_dirs = None
+
+         elif name in linkdirs:
+            link_dest = os.path.realpath ( self.get_fspath ( attr_relpath ) )
+            link_dest_prefix = link_dest + os.path.sep
+            if any (
+               ( real_dir + os.path.sep ).startswith ( link_dest_prefix )
+               for real_dir in real_dirs
+            ):
+               continue
+            sub_real_dirs = real_dirs + [ link_dest ]
+
+         else:
+            sub_real_dirs = (
+               real_dirs[:-1] + [ os.path.join ( real_dirs[-1], name ) ]
+            )
+         # --
+
+         for attr_normkey in self._iregex_keys (
+            regex, prefix, attr_relpath, sub_real_dirs
+         ):
+            yield attr_normkey
+      # --
+   # --- end of _iregex_keys (...) ---
+
+   def _iquery_keys ( self, patterns, followlinks=None ):
+      """Generator that yields the normalized keys of all attributes
+      matching any of the given patterns, see L{iquery()}.
+
+      @param patterns:    glob patterns and/or compiled regexps
+      @type  patterns:    iterable
+      @param followlinks: see L{iquery()}
+      @type  followlinks: bool or None
+      """
+      seen = set()
+
+      for pattern in patterns:
+         if hasattr ( pattern, 'match' ):
+            prefix     = _get_regex_literal_prefix ( pattern )
+            start_dir  = prefix.rpartition ( os.path.sep )[0]
+            if followlinks:
+               real_dirs = [
+                  os.path.realpath ( self.get_fspath ( start_dir ) )
+               ]
+            else:
+               real_dirs = None
+
+            attr_gen = self._iregex_keys (
+               pattern, prefix, start_dir, real_dirs
+            )
+
+         else:
+            parts = os.path.normpath ( pattern ).lstrip ( os.path.sep ).split (
+               os.path.sep
+            )
+            # the literal prefix of the pattern, excluding the file name part
+            literal_len = 0
+            while (
+               literal_len < len(parts) - 1
+               and _RE_GLOB_MAGIC.search ( parts[literal_len] ) is None
+            ):
+               literal_len += 1
+
+            attr_gen = self._iglob_keys (
+               os.path.sep.join ( parts[:literal_len] ), parts[literal_len:],
+               followlinks is None or followlinks
+            )
+         # --
+
+         for attr_normkey in attr_gen:
+            if attr_normkey not in seen:
+               seen.add ( attr_normkey )
+               yield attr_normkey
+      # -- end for
+   # --- end of _iquery_keys (...) ---
+
+   def iquery ( self, *patterns, **kwargs ):
+      """Generator that yields a series of 2-tuples C{(normalized key,value)}
+      for all attributes matching any of the given patterns.
+
+      Glob patterns (C{str}) are matched per path component,
+      e.g. C{*/statistics/rx_bytes}.
+      Compiled regexps are matched against the normalized key
+      with C{match()}, e.g. C{re.compile(r'power/[^/]+$')}.
+      Only directories that can contain matching keys, as determined by
+      the literal prefix of each pattern, get traversed.
+
+      By default, glob queries descend into symlinks to directories
+      (their depth is bounded by the pattern), whereas regexp queries
+      do not, since sysfs device dirs link to large parts of /sys.
+      When following symlinks in regexp queries, symlink loops are skipped,
+      but the traversal may still reach far beyond L{root}.
+
+      Directory listings are cached and may be outdated after devices
+      have been added or removed, see L{drop_index()}.
+      Each attribute key is yielded at most once.
+
+      @param patterns:       glob patterns and/or compiled regexps
+      @type  patterns:       *args
+      @keyword followlinks:  whether to descend into symlinks to directories.
+                             Defaults to None (=> glob queries only).
+      @type  followlinks:    bool or None
+      @param kwargs:         see L{_iget_attributes_v()}
+      """
+      followlinks = kwargs.pop ( 'followlinks', None )
+      return self._iget_attributes_v (
+         self._iquery_keys ( patterns, followlinks=followlinks ), **kwargs
+      )
+   # --- end of iquery (...) ---
+
+   def query ( self, *patterns, **kwargs ):
+      """Similar to L{iquery()}, but returns a list of 2-tuples."""
+      return list ( self.iquery ( *patterns, **kwargs ) )
+   # --- end of query (...) ---
+
 # --- end of ReadonlySysFsAttrDict ---
 
 